@@ -5,6 +5,7 @@ Slack Auto Notes - Transform raw Slack copies into organized Obsidian notes with
 
 import os
 import re
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 import openai
@@ -26,6 +27,9 @@ if config_file.exists():
     MAX_TOKENS = config.getint('settings', 'max_tokens', fallback=2000)
     TEMPERATURE = config.getfloat('settings', 'temperature', fallback=0.3)
     ARCHIVE_FOLDER = config.get('settings', 'archive_folder', fallback="Slack Archives")
+    REQUESTS_PER_MINUTE = config.getint('settings', 'requests_per_minute', fallback=500)
+    TOKENS_PER_MINUTE = config.getint('settings', 'tokens_per_minute', fallback=200000)
+    TOKEN_BUDGET = config.getint('settings', 'token_budget', fallback=0)
 else:
     # Default configuration
     OBSIDIAN_VAULT = Path("~/Documents/Obsidian Vault").expanduser()
@@ -34,16 +38,186 @@ else:
     MAX_TOKENS = 2000
     TEMPERATURE = 0.3
     ARCHIVE_FOLDER = "Slack Archives"
+    REQUESTS_PER_MINUTE = 500
+    TOKENS_PER_MINUTE = 200000
+    TOKEN_BUDGET = 0
     print("⚠️ Warning: config.ini not found. Please create it from the template.")
 
 if OPENAI_API_KEY and OPENAI_API_KEY != "YOUR_OPENAI_API_KEY_HERE":
     openai.api_key = OPENAI_API_KEY
 
 
+class RateLimitedError(Exception):
+    """Raised when a request is still rate limited after all scheduler retries."""
+
+
+def is_quota_error(error):
+    """True for the 429 OpenAI returns when billing/quota is exhausted (retrying won't help)."""
+    if getattr(error, 'code', None) == 'insufficient_quota':
+        return True
+    body = getattr(error, 'body', None)
+    if isinstance(body, dict):
+        details = body.get('error', body)
+        if isinstance(details, dict):
+            return 'insufficient_quota' in (details.get('type'), details.get('code'))
+    return False
+
+
+def parse_reset_seconds(value):
+    """Parse OpenAI reset headers like '20ms', '1.5s', '6m0s' or a bare number of seconds."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', str(value or ''))
+    if not parts:
+        return None
+    units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+def retry_after_seconds(error):
+    """How long a 429 asks us to wait, from its response headers (None if not given)."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms is not None:
+        seconds = parse_reset_seconds(retry_after_ms)
+        if seconds is not None:
+            return seconds / 1000
+    retry_after = parse_reset_seconds(headers.get('retry-after'))
+    if retry_after is not None:
+        return retry_after
+    # Otherwise wait for whichever limit (requests or tokens) resets last
+    resets = [parse_reset_seconds(headers.get(header))
+              for header in ('x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens')]
+    resets = [seconds for seconds in resets if seconds is not None]
+    return max(resets) if resets else None
+
+
+class TokenScheduler:
+    """Keep AI calls under the OpenAI RPM/TPM limits and a per-run token budget."""
+
+    MAX_RETRIES = 5
+    RETRYABLE_ERRORS = (openai.APIConnectionError, openai.InternalServerError)  # includes timeouts
+
+    def __init__(self, requests_per_minute, tokens_per_minute, token_budget=None):
+        # None/0 = unlimited for the rate limits and the budget alike
+        self.rpm = requests_per_minute if requests_per_minute and requests_per_minute > 0 else None
+        self.tpm = tokens_per_minute if tokens_per_minute and tokens_per_minute > 0 else None
+        self.token_budget = token_budget or None
+        self.tokens_used = 0
+        self.request_tokens = float(self.rpm or 0)
+        self.token_tokens = float(self.tpm or 0)
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+
+    @staticmethod
+    def estimate_tokens(chat_messages, max_tokens=MAX_TOKENS):
+        """Rough token estimate: ~4 chars per token plus the completion allowance."""
+        prompt_chars = sum(len(m['content']) for m in chat_messages)
+        return prompt_chars // 4 + 4 * len(chat_messages) + max_tokens
+
+    def remaining_budget(self):
+        if self.token_budget is None:
+            return None
+        return max(0, self.token_budget - self.tokens_used)
+
+    def fits_budget(self, estimate):
+        remaining = self.remaining_budget()
+        return remaining is None or estimate <= remaining
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        if self.rpm:
+            self.request_tokens = min(self.rpm, self.request_tokens + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.token_tokens = min(self.tpm, self.token_tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, estimate):
+        """Block until both buckets have room for one request of ``estimate`` tokens."""
+        # A request larger than the whole TPM bucket can only wait for a full bucket
+        needed = min(estimate, self.tpm) if self.tpm else 0
+        while True:
+            # Honor a server-requested pause before anything else
+            pause = self.blocked_until - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            self._refill()
+            requests_ok = not self.rpm or self.request_tokens >= 1
+            tokens_ok = not self.tpm or self.token_tokens >= needed
+            if requests_ok and tokens_ok:
+                if self.rpm:
+                    self.request_tokens -= 1
+                if self.tpm:
+                    self.token_tokens -= needed
+                return
+            wait = 0
+            if not requests_ok:
+                wait = (1 - self.request_tokens) * 60 / self.rpm
+            if not tokens_ok:
+                wait = max(wait, (needed - self.token_tokens) * 60 / self.tpm)
+            time.sleep(max(wait, 0.05))
+
+    def record(self, estimate, actual):
+        """Charge the budget with real usage and refund/charge the TPM bucket the difference."""
+        actual = actual if actual is not None else estimate
+        self.tokens_used += actual
+        if self.tpm:
+            self.token_tokens = min(self.tpm, self.token_tokens + min(estimate, self.tpm) - actual)
+
+    def call(self, request_fn, estimate):
+        """Run ``request_fn`` under the rate limits, retrying 429s and transient errors.
+
+        ``request_fn`` must not retry on its own (use a client with ``max_retries=0``)
+        so every attempt goes through the buckets.
+        """
+        for attempt in range(self.MAX_RETRIES):
+            self.acquire(estimate)
+            try:
+                response = request_fn()
+            except openai.RateLimitError as e:
+                if is_quota_error(e):
+                    raise
+                # Pause every queued call for as long as the server asked (or back off)
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = 2 ** attempt
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+                print(f"   ⏳ Rate limited, retrying in {delay:g}s...")
+                continue
+            except self.RETRYABLE_ERRORS as e:
+                if attempt == self.MAX_RETRIES - 1:
+                    raise
+                delay = 2 ** attempt
+                print(f"   ⏳ {type(e).__name__}, retrying in {delay}s...")
+                time.sleep(delay)
+                continue
+            usage = getattr(response, 'usage', None)
+            self.record(estimate, getattr(usage, 'total_tokens', None))
+            return response
+        raise RateLimitedError(f"still rate limited after {self.MAX_RETRIES} attempts")
+
+
 class NotesVibe:
-    def __init__(self):
+    def __init__(self, token_budget=None):
         self.vault_path = OBSIDIAN_VAULT / ARCHIVE_FOLDER
         self.vault_path.mkdir(parents=True, exist_ok=True)
+        if token_budget is None:
+            token_budget = TOKEN_BUDGET
+        for name, value in (('requests_per_minute', REQUESTS_PER_MINUTE),
+                            ('tokens_per_minute', TOKENS_PER_MINUTE),
+                            ('token_budget', token_budget)):
+            if value < 0:
+                raise ValueError(f"{name} must be 0 (unlimited) or positive, got {value}")
+        self.scheduler = TokenScheduler(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, token_budget)
+        # The scheduler owns retries, so the SDK must not retry/sleep behind its back
+        self.client = openai.OpenAI(api_key=OPENAI_API_KEY, max_retries=0) if OPENAI_API_KEY else None
+        self.deferred = []  # (channel_name, reason) for channels skipped until a later run
+        self.quota_exhausted = False
         
     def parse_slack_text(self, raw_text, channel_name):
         """Parse the raw Slack text into structured messages."""
@@ -209,13 +383,8 @@ class NotesVibe:
         
         return content.strip()
     
-    def create_ai_summary(self, messages, channel_name):
-        """Use AI to create organized notes, not just a summary."""
-        if not OPENAI_API_KEY:
-            return None
-            
-        print(f"   🤖 Creating organized notes for {channel_name}...")
-        
+    def build_ai_messages(self, messages, channel_name):
+        """Build the chat messages sent to the AI for a channel."""
         # Prepare context for AI - give it ALL messages with clear author attribution
         conversation = "\n\n".join([
             f"MESSAGE FROM: {msg.get('author', 'Unknown')}\nTIME: {msg.get('time', 'no time')}\nCONTENT: {msg['content']}\n---"
@@ -286,29 +455,67 @@ CRITICAL:
 - Links are the MOST valuable - extract every single one with context
 - Keep it simple and CLEAN"""
 
+        return [
+            {"role": "system", "content": "You are a helpful assistant that extracts and organizes information from Slack conversations. CRITICAL RULES: 1) Extract ALL URLs exactly as they appear. 2) ONLY attribute links to the person who actually shared them - check MESSAGE FROM field. 3) Use ONLY the context that actually appears in the messages - DO NOT make up or infer context. 4) If context is unclear, say 'Shared without additional context' rather than guessing."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def create_ai_summary(self, messages, channel_name, chat_messages=None, estimate=None):
+        """Use AI to create organized notes, not just a summary."""
+        if not OPENAI_API_KEY:
+            return None
+
+        if self.quota_exhausted:
+            self.defer(channel_name, "OpenAI quota exhausted")
+            return None
+
+        if chat_messages is None:
+            chat_messages = self.build_ai_messages(messages, channel_name)
+        if estimate is None:
+            estimate = self.scheduler.estimate_tokens(chat_messages)
+
+        if not self.scheduler.fits_budget(estimate):
+            self.defer(channel_name, "token budget ran out",
+                       f"~{estimate} needed, {self.scheduler.remaining_budget()} left")
+            return None
+
+        print(f"   🤖 Creating organized notes for {channel_name} (~{estimate} tokens)...")
+
         try:
             # Use the new OpenAI API format (v2.x)
-            import openai
-            
-            client = openai.OpenAI(api_key=OPENAI_API_KEY)
-            
-            response = client.chat.completions.create(
-                model=MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that extracts and organizes information from Slack conversations. CRITICAL RULES: 1) Extract ALL URLs exactly as they appear. 2) ONLY attribute links to the person who actually shared them - check MESSAGE FROM field. 3) Use ONLY the context that actually appears in the messages - DO NOT make up or infer context. 4) If context is unclear, say 'Shared without additional context' rather than guessing."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=MAX_TOKENS,
-                temperature=TEMPERATURE
+            response = self.scheduler.call(
+                lambda: self.client.chat.completions.create(
+                    model=MODEL,
+                    messages=chat_messages,
+                    max_tokens=MAX_TOKENS,
+                    temperature=TEMPERATURE
+                ),
+                estimate
             )
             
             summary = response.choices[0].message.content
             print(f"   ✅ AI organized notes created")
             return summary
             
+        except RateLimitedError as e:
+            self.defer(channel_name, "rate limited", str(e))
+            return None
         except Exception as e:
-            print(f"   ⚠️ AI error: {e}")
+            if isinstance(e, openai.RateLimitError) and is_quota_error(e):
+                self.quota_exhausted = True
+                self.defer(channel_name, "OpenAI quota exhausted")
+            else:
+                print(f"   ⚠️ AI error: {e}")
             return None
+
+    def defer(self, channel_name, reason, detail=None):
+        """Skip a channel for this run so a later run can archive it with AI notes."""
+        suffix = f" ({detail})" if detail else ""
+        print(f"   ⏭️ {channel_name}: {reason}{suffix} - skipping, rerun later")
+        self.deferred.append((channel_name, reason))
+
+    def is_deferred(self, channel_name):
+        return any(name == channel_name for name, _ in self.deferred)
     
     def format_messages_markdown(self, messages):
         """Format messages to look clean like Slack."""
@@ -577,8 +784,8 @@ tags: [slack-archive, {safe_channel_name.lower().replace(' ', '-')}]
             
         print(f"   ✅ Updated index")
     
-    def process_file(self, filepath, channel_name=None):
-        """Process a single text file."""
+    def load_file(self, filepath, channel_name=None):
+        """Read and parse a single text file."""
         print(f"\n📂 Processing: {filepath}")
         
         # Read the file
@@ -595,8 +802,16 @@ tags: [slack-archive, {safe_channel_name.lower().replace(' ', '-')}]
         messages = self.parse_slack_text(raw_text, channel_name)
         print(f"   📝 Parsed {len(messages)} messages")
         
+        return channel_name, messages, raw_text
+    
+    def process_file(self, filepath, channel_name=None):
+        """Process a single text file."""
+        channel_name, messages, raw_text = self.load_file(filepath, channel_name)
+        
         # Create AI summary
         ai_summary = self.create_ai_summary(messages, channel_name)
+        if self.is_deferred(channel_name):
+            return False
         
         # Save to Obsidian
         self.save_to_obsidian(channel_name, messages, ai_summary, raw_text)
@@ -610,14 +825,54 @@ tags: [slack-archive, {safe_channel_name.lower().replace(' ', '-')}]
         
         print(f"\n📁 Found {len(txt_files)} text files to process")
         
+        # Parse everything first so channels can be scheduled by size
+        jobs = []
         for filepath in txt_files:
             try:
-                self.process_file(filepath)
+                channel_name, messages, raw_text = self.load_file(filepath)
+                chat_messages = self.build_ai_messages(messages, channel_name)
+                estimate = self.scheduler.estimate_tokens(chat_messages)
+                jobs.append((estimate, filepath, channel_name, messages, raw_text, chat_messages))
+            except Exception as e:
+                print(f"   ❌ Error with {filepath.name}: {e}")
+        
+        # With a budget, go smallest first so it covers as many channels as possible
+        if self.scheduler.token_budget is not None:
+            jobs.sort(key=lambda job: job[0])
+        
+        for estimate, filepath, channel_name, messages, raw_text, chat_messages in jobs:
+            print(f"\n🤖 {channel_name} ({filepath.name})")
+            try:
+                ai_summary = self.create_ai_summary(messages, channel_name, chat_messages, estimate)
+                if self.is_deferred(channel_name):
+                    continue
+                self.save_to_obsidian(channel_name, messages, ai_summary, raw_text)
                 print(f"   ✅ Completed: {filepath.name}")
             except Exception as e:
                 print(f"   ❌ Error with {filepath.name}: {e}")
                 
         print(f"\n✨ Processed {len(txt_files)} files!")
+        if self.scheduler.token_budget is not None:
+            print(f"   💸 Used ~{self.scheduler.tokens_used} of {self.scheduler.token_budget} budgeted tokens")
+        if self.deferred:
+            by_reason = {}
+            for channel_name, reason in self.deferred:
+                by_reason.setdefault(reason, []).append(channel_name)
+            for reason, channels in by_reason.items():
+                print(f"   ⏭️ Not archived ({reason}), rerun to archive: {', '.join(channels)}")
+
+
+def non_negative_int(value):
+    """argparse type for counts where 0 means unlimited."""
+    import argparse
+
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 (unlimited) or positive, got {number}")
+    return number
 
 
 def main():
@@ -627,6 +882,8 @@ def main():
     parser.add_argument('-f', '--file', help='Path to a single text file')
     parser.add_argument('-d', '--directory', help='Path to directory with text files')
     parser.add_argument('-c', '--channel', help='Channel/DM name (optional)')
+    parser.add_argument('-b', '--token-budget', type=non_negative_int,
+                        help='Max OpenAI tokens to spend this run (0 = unlimited, overrides config)')
     
     args = parser.parse_args()
     
@@ -637,7 +894,10 @@ def main():
 ╚══════════════════════════════════════════════════════════════╝
     """)
     
-    vibe = NotesVibe()
+    try:
+        vibe = NotesVibe(token_budget=args.token_budget)
+    except ValueError as e:
+        parser.error(f"{e} (check config.ini)")
     
     # Handle command line arguments
     if args.file: